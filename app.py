@@ -1,15 +1,18 @@
 import os
-import json
 import re
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from threading import RLock
 
-import requests
-from flask import Flask, render_template, request, jsonify
+import click
+import httpx
+import orjson
+from cachetools import TTLCache
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import JSONProvider
 
 from psycopg_pool import ConnectionPool
-from psycopg.errors import UniqueViolation
 
 try:
 	from flask_cors import CORS
@@ -17,6 +20,11 @@ try:
 except Exception:
 	ENABLE_CORS = False
 
+try:
+	import redis
+except Exception:
+	redis = None
+
 def _env(name, default=""):
 	v = os.getenv(name, default)
 	return (v or "").strip().strip('"').strip("'")
@@ -28,22 +36,108 @@ def _env(name, default=""):
 APPYFLOW_VERIFY_URL = _env("APPYFLOW_VERIFY_URL", "https://appyflow.in/api/verifyGST")
 APPYFLOW_KEY_SECRET = _env("APPYFLOW_KEY_SECRET")
 DATABASE_URL = _env("DATABASE_URL")  # Neon Postgres connection string (sslmode=require)
+REDIS_URL = _env("REDIS_URL")  # optional; shares verify results across workers/instances
+VERIFY_BATCH_MAX = int(_env("VERIFY_BATCH_MAX", "50"))
+SUBMIT_BATCH_MAX = int(_env("SUBMIT_BATCH_MAX", "500"))
+
+VERIFY_CACHE_TTL = 3600
+APPYFLOW_MAX_BODY_BYTES = 65536
+MAX_BODY_BYTES = 4096
+MAX_BATCH_BODY_BYTES = 1 << 20
+SUBMISSION_FIELD_MAXLEN = {
+	"gstn": 128,
+	"legal_name": 512,
+	"firm_name": 512,
+	"name1": 128,
+	"name2": 128,
+	"contact": 128,
+}
 
 GSTIN_REGEX = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][A-Z0-9]Z[A-Z0-9]$")
 
 logging.basicConfig(level=_env("LOG_LEVEL", "INFO"))
 log = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and the AppyFlow key_secret is a query parameter.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# ---------------------------
+# AppyFlow HTTP client (HTTP/2: concurrent verifies multiplex over one connection)
+# ---------------------------
+
+_http = httpx.Client(
+	timeout=9.0,
+	follow_redirects=True,
+	headers={"Accept": "application/json"},
+	# retries only covers connect failures; limits/http2 must live on the transport when one is passed.
+	transport=httpx.HTTPTransport(
+		http2=True,
+		retries=2,
+		limits=httpx.Limits(max_keepalive_connections=16, max_connections=64),
+	),
+)
+
+# Successful verifications only; error responses always go back to AppyFlow.
+# The in-process cache sits in front of the optional Redis cache.
+_verify_cache = TTLCache(maxsize=4096, ttl=VERIFY_CACHE_TTL)
+_verify_lock = RLock()
+
+_redis = None
+if redis is not None and REDIS_URL:
+	_redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.5)
+
+def _cache_get(gstn):
+	with _verify_lock:
+		hit = _verify_cache.get(gstn)
+	if hit is not None or _redis is None:
+		return hit
+	try:
+		cached = _redis.get(f"gst:{gstn}")
+		if cached is None:
+			return None
+		hit = orjson.loads(cached)
+	except (redis.RedisError, orjson.JSONDecodeError):
+		log.warning("Redis get failed", exc_info=True)
+		return None
+	with _verify_lock:
+		_verify_cache[gstn] = hit
+	return hit
+
+def _cache_put(gstn, result):
+	with _verify_lock:
+		_verify_cache[gstn] = result
+	if _redis is None:
+		return
+	try:
+		_redis.setex(f"gst:{gstn}", VERIFY_CACHE_TTL, orjson.dumps(result))
+	except redis.RedisError:
+		log.warning("Redis set failed", exc_info=True)
+
+# Fans out /api/verify_gst_batch lookups; shares _http and _verify_cache.
+_verify_executor = ThreadPoolExecutor(max_workers=16)
 
 # ---------------------------
 # APP
 # ---------------------------
 
+class ORJSONProvider(JSONProvider):
+	"""Route request.get_json() and jsonify() through orjson."""
+
+	def dumps(self, obj, **kwargs):
+		return orjson.dumps(obj).decode()
+
+	def loads(self, s, **kwargs):
+		return orjson.loads(s)
+
 BASE_DIR = Path(__file__).resolve().parent
 app = Flask(
 	__name__,
 	template_folder=str(BASE_DIR / "templates"),
 	static_folder=str(BASE_DIR / "static"),
 )
+app.json = ORJSONProvider(app)
+# Hard cap for every route. One byte of headroom lets _json_body see that a
+# chunked body (no Content-Length) ran past its limit instead of reading a truncated one.
+app.config["MAX_CONTENT_LENGTH"] = MAX_BATCH_BODY_BYTES + 1
 
 if ENABLE_CORS and _env("ENABLE_CORS", "0") == "1":
 	origins = [o.strip() for o in _env("API_ALLOWED_ORIGINS", "").split(",") if o.strip()]
@@ -54,79 +148,110 @@ if ENABLE_CORS and _env("ENABLE_CORS", "0") == "1":
 # ---------------------------
 
 pool = None
-_schema_ready = False
 
 def get_pool():
-	global pool, _schema_ready
+	global pool
 
 	if not DATABASE_URL:
 		raise RuntimeError("Missing DATABASE_URL env var (Neon connection string).")
 
 	if pool is None:
-		pool = ConnectionPool(conninfo=DATABASE_URL, min_size=0, max_size=5, timeout=20)
-
-	if not _schema_ready:
-		with pool.connection() as conn:
-			with conn.cursor() as cur:
-				# Base table with gstn as PRIMARY KEY
-				cur.execute("""
-					create table if not exists submissions (
-						gstn text primary key,
-						legal_name text not null,
-						firm_name text not null,
-						name1 text not null,
-						name2 text,
-						contact text not null,
-						created_at timestamptz not null default now()
-					);
-				""")
-				# Migration helper: if an old 'id' column/PK exists, drop it; ensure PK on gstn
-				cur.execute("""
-					do $$
-					begin
-					  if exists (
-					    select 1 from information_schema.columns
-					    where table_name = 'submissions' and column_name = 'id'
-					  ) then
-					    begin
-					      execute 'alter table submissions drop constraint if exists submissions_pkey';
-					      execute 'alter table submissions drop column if exists id';
-					    exception when others then null;
-					    end;
-					  end if;
-
-					  if not exists (
-					    select 1
-					    from information_schema.table_constraints tc
-					    join information_schema.key_column_usage kcu
-					      on tc.constraint_name = kcu.constraint_name
-					     and tc.table_name = kcu.table_name
-					    where tc.table_name = 'submissions'
-					      and tc.constraint_type = 'PRIMARY KEY'
-					      and kcu.column_name = 'gstn'
-					  ) then
-					    begin
-					      execute 'alter table submissions add primary key (gstn)';
-					    exception when others then null;
-					    end;
-					  end if;
-					end$$;
-				""")
-		_schema_ready = True
+		pool = ConnectionPool(
+			conninfo=DATABASE_URL,
+			min_size=int(_env("DB_POOL_MIN_SIZE", "2")),
+			max_size=int(_env("DB_POOL_MAX_SIZE", "32")),
+			max_idle=300,
+			max_lifetime=3600,
+			timeout=20,
+		)
 
 	return pool
 
+def ensure_schema():
+	"""Create/migrate the submissions table. Run once per deploy, not per request."""
+	with get_pool().connection() as conn:
+		with conn.cursor() as cur:
+			# Base table with gstn as PRIMARY KEY
+			cur.execute("""
+				create table if not exists submissions (
+					gstn text primary key,
+					legal_name text not null,
+					firm_name text not null,
+					name1 text not null,
+					name2 text,
+					contact text not null,
+					created_at timestamptz not null default now()
+				);
+			""")
+			# Migration helper: if an old 'id' column/PK exists, drop it; ensure PK on gstn
+			cur.execute("""
+				do $$
+				begin
+				  if exists (
+				    select 1 from information_schema.columns
+				    where table_name = 'submissions' and column_name = 'id'
+				  ) then
+				    begin
+				      execute 'alter table submissions drop constraint if exists submissions_pkey';
+				      execute 'alter table submissions drop column if exists id';
+				    exception when others then null;
+				    end;
+				  end if;
+
+				  if not exists (
+				    select 1
+				    from information_schema.table_constraints tc
+				    join information_schema.key_column_usage kcu
+				      on tc.constraint_name = kcu.constraint_name
+				     and tc.table_name = kcu.table_name
+				    where tc.table_name = 'submissions'
+				      and tc.constraint_type = 'PRIMARY KEY'
+				      and kcu.column_name = 'gstn'
+				  ) then
+				    begin
+				      execute 'alter table submissions add primary key (gstn)';
+				    exception when others then null;
+				    end;
+				  end if;
+				end$$;
+			""")
+
+@app.cli.command("ensure-schema")
+def ensure_schema_command():
+	"""Create or migrate the submissions table."""
+	ensure_schema()
+	click.echo("Schema ready.")
+
+if DATABASE_URL and _env("SCHEMA_BOOTSTRAP", "0") == "1":
+	ensure_schema()
+
+# Open the pool at worker boot (gunicorn imports the app after forking) instead of on the first request.
+if DATABASE_URL and _env("PREWARM_DB", "1") == "1":
+	try:
+		# Block until min_size connections are open so the first request doesn't pay the handshake.
+		get_pool().wait(timeout=10)
+	except Exception:
+		log.warning("Postgres pre-warm timed out; the pool keeps connecting in the background", exc_info=True)
+
 # ---------------------------
 # ROUTES
 # ---------------------------
 
+@app.errorhandler(413)
+def request_too_large(e):
+	return jsonify({"ok": False, "message": "Request body too large."}), 413
+
 @app.get("/favicon.ico")
 def favicon():
 	return app.send_static_file("favicon.ico")
 
+# index.html has no template variables, so render it once per worker.
+with app.app_context():
+	_INDEX_HTML = render_template("index.html").encode("utf-8")
+
 @app.get("/")
 def home():
-	return render_template("index.html")
+	return Response(_INDEX_HTML, mimetype="text/html", headers={"Cache-Control": "public, max-age=300"})
 
 @app.get("/healthz")
 def healthz():
@@ -138,64 +263,189 @@ def healthz():
 	except Exception as e:
 		return jsonify({"status": "degraded", "db": str(e)}), 200
 
-@app.post("/api/verify_gst")
-def verify_gst():
-	data = request.get_json(silent=True) or {}
-	gstn = (data.get("gstn") or "").strip().upper()
-
+def _json_body(max_bytes):
+	"""Parsed JSON object body, {} if malformed, or None if the body exceeds max_bytes."""
+	if (request.content_length or 0) > max_bytes:
+		return None
+	if not request.is_json:
+		return {}
+	# Read the stream directly so chunked bodies are measured, not silently truncated.
+	raw = request.stream.read(max_bytes + 1)
+	if len(raw) > max_bytes:
+		return None
+	try:
+		data = orjson.loads(raw)
+	except orjson.JSONDecodeError:
+		return {}
+	return data if isinstance(data, dict) else {}
+
+def _norm(d, k, maxlen=128, upper=False):
+	"""Stripped string field, or "" if missing, not a string, empty or over maxlen."""
+	v = d.get(k)
+	if not isinstance(v, str) or not 0 < len(v) <= maxlen:
+		return ""
+	v = v.strip()
+	return v.upper() if upper else v
+
+def _field_error(d, k, maxlen):
+	"""Message for a present field that is not a string or is over maxlen, else None."""
+	v = d.get(k)
+	if v is None:
+		return None
+	if not isinstance(v, str):
+		return f"{k} must be a string."
+	if len(v) > maxlen:
+		return f"{k} must be at most {maxlen} characters."
+	return None
+
+def _gstin_error(gstn):
 	if not gstn:
-		return jsonify({"ok": False, "message": "GSTIN is required."}), 400
+		return "GSTIN is required."
 	if len(gstn) != 15:
-		return jsonify({"ok": False, "message": "GSTIN must be exactly 15 characters."}), 400
+		return "GSTIN must be exactly 15 characters."
 	if not GSTIN_REGEX.match(gstn):
-		return jsonify({"ok": False, "message": "GSTIN format looks invalid."}), 400
+		return "GSTIN format looks invalid."
+	return None
+
+def _verify_one(gstn):
+	"""Look up an already-validated GSTIN on AppyFlow; returns (body, status)."""
+	# Bind config to locals once; this runs for every verification.
+	url, key_secret = APPYFLOW_VERIFY_URL, APPYFLOW_KEY_SECRET
 
-	if not APPYFLOW_KEY_SECRET:
-		return jsonify({"ok": False, "message": "Server missing APPYFLOW_KEY_SECRET."}), 500
+	hit = _cache_get(gstn)
+	if hit is not None:
+		return hit, 200
+
+	if not key_secret:
+		return {"ok": False, "message": "Server missing APPYFLOW_KEY_SECRET."}, 500
 
 	try:
-		resp = requests.get(
-			APPYFLOW_VERIFY_URL,
-			params={"gstNo": gstn, "key_secret": APPYFLOW_KEY_SECRET},
-			timeout=9
-		)
-		resp.raise_for_status()
-	except requests.RequestException as e:
-		log.exception("AppyFlow request failed")
-		return jsonify({"ok": False, "message": f"Error contacting AppyFlow: {e}"}), 502
+		with _http.stream("GET", url, params={"gstNo": gstn, "key_secret": key_secret}) as resp:
+			resp.raise_for_status()
+			# Read at most one byte past the cap so oversized bodies are never buffered or parsed.
+			body = b""
+			for chunk in resp.iter_bytes(16384):
+				body += chunk
+				if len(body) > APPYFLOW_MAX_BODY_BYTES:
+					break
+	except httpx.HTTPStatusError as e:
+		log.error("AppyFlow returned HTTP %s", e.response.status_code)
+		return {"ok": False, "message": f"AppyFlow returned HTTP {e.response.status_code}."}, 502
+	except httpx.HTTPError as e:
+		# httpx error text can carry the request URL, whose query string holds key_secret.
+		log.error("AppyFlow request failed: %s", type(e).__name__)
+		return {"ok": False, "message": "Error contacting AppyFlow."}, 502
+
+	if len(body) > APPYFLOW_MAX_BODY_BYTES:
+		return {"ok": False, "message": "AppyFlow response too large."}, 502
 
 	try:
-		payload = resp.json()
-	except json.JSONDecodeError:
-		return jsonify({"ok": False, "message": "Invalid JSON from AppyFlow."}), 502
+		payload = orjson.loads(body)
+	except orjson.JSONDecodeError:
+		return {"ok": False, "message": "Invalid JSON from AppyFlow."}, 502
+
+	if not isinstance(payload, dict):
+		return {"ok": False, "message": "Unexpected response from AppyFlow."}, 502
 
 	if payload.get("error") is True:
-		return jsonify({"ok": False, "message": payload.get("message", "GST verification failed.")}), 400
+		return {"ok": False, "message": payload.get("message", "GST verification failed.")}, 400
 
-	info = (payload or {}).get("taxpayerInfo") or {}
-	legal_name = (info.get("lgnm") or "").strip()
-	firm_name  = (info.get("tradeNam") or "").strip()
+	info = payload.get("taxpayerInfo")
+	if not isinstance(info, dict):
+		info = {}
+	legal_name = info.get("lgnm")
+	firm_name  = info.get("tradeNam")
+	legal_name = legal_name.strip() if isinstance(legal_name, str) else ""
+	firm_name  = firm_name.strip() if isinstance(firm_name, str) else ""
 
 	if not legal_name and not firm_name:
-		return jsonify({"ok": False, "message": "Could not find Legal Name / Firm Name for this GSTIN."}), 404
+		return {"ok": False, "message": "Could not find Legal Name / Firm Name for this GSTIN."}, 404
 
-	return jsonify({"ok": True, "gstn": gstn, "legal_name": legal_name, "firm_name": firm_name})
-
-@app.post("/submit")
-def submit():
-	data = request.get_json(silent=True) or {}
+	result = {"ok": True, "gstn": gstn, "legal_name": legal_name, "firm_name": firm_name}
+	_cache_put(gstn, result)
+	return result, 200
 
-	gstn = (data.get("gstn") or "").strip().upper()
-	legal_name = (data.get("legal_name") or "").strip()
-	firm_name  = (data.get("firm_name") or "").strip()
-	name1      = (data.get("name1") or "").strip()
-	name2      = (data.get("name2") or "").strip()
-	contact    = (data.get("contact") or "").strip()
+@app.post("/api/verify_gst")
+def verify_gst():
+	data = _json_body(MAX_BODY_BYTES)
+	if data is None:
+		return jsonify({"ok": False, "message": "Request body too large."}), 413
+	gstn = _norm(data, "gstn", SUBMISSION_FIELD_MAXLEN["gstn"], upper=True)
+
+	error = _field_error(data, "gstn", SUBMISSION_FIELD_MAXLEN["gstn"]) or _gstin_error(gstn)
+	if error:
+		return jsonify({"ok": False, "message": error}), 400
+
+	body, status = _verify_one(gstn)
+	return jsonify(body), status
+
+@app.post("/api/verify_gst_batch")
+def verify_gst_batch():
+	data = _json_body(MAX_BATCH_BODY_BYTES)
+	if data is None:
+		return jsonify({"ok": False, "message": "Request body too large."}), 413
+	gstns = data.get("gstns")
+
+	if not isinstance(gstns, list) or not gstns:
+		return jsonify({"ok": False, "message": "gstns must be a non-empty list."}), 400
+	if len(gstns) > VERIFY_BATCH_MAX:
+		return jsonify({"ok": False, "message": f"At most {VERIFY_BATCH_MAX} GSTINs per batch."}), 400
+
+	items = [{"gstn": g} for g in gstns]
+	gstns = [_norm(item, "gstn", SUBMISSION_FIELD_MAXLEN["gstn"], upper=True) for item in items]
+	results = [None] * len(gstns)
+	# Each distinct GSTIN goes upstream once; repeats share its result by index.
+	pending = {}
+	for i, gstn in enumerate(gstns):
+		error = _field_error(items[i], "gstn", SUBMISSION_FIELD_MAXLEN["gstn"]) or _gstin_error(gstn)
+		if error:
+			results[i] = {"ok": False, "gstn": gstn, "message": error}
+		else:
+			pending.setdefault(gstn, []).append(i)
+
+	futures = {gstn: _verify_executor.submit(_verify_one, gstn) for gstn in pending}
+	for gstn, indexes in pending.items():
+		# One item's failure must not take down the rest of the batch.
+		try:
+			body, _status = futures[gstn].result()
+		except Exception:
+			log.exception("GST verification failed for a batch item")
+			body = {"ok": False, "message": "Unexpected error verifying this GSTIN."}
+		for i in indexes:
+			results[i] = {"gstn": gstn, **body}
+
+	return jsonify({"results": results})
+
+def _submission_row(data):
+	"""Normalize a submission payload; returns (row, error message)."""
+	for k, maxlen in SUBMISSION_FIELD_MAXLEN.items():
+		error = _field_error(data, k, maxlen)
+		if error:
+			return None, error
+
+	gstn       = _norm(data, "gstn", SUBMISSION_FIELD_MAXLEN["gstn"], upper=True)
+	legal_name = _norm(data, "legal_name", SUBMISSION_FIELD_MAXLEN["legal_name"])
+	firm_name  = _norm(data, "firm_name", SUBMISSION_FIELD_MAXLEN["firm_name"])
+	name1      = _norm(data, "name1", SUBMISSION_FIELD_MAXLEN["name1"])
+	name2      = _norm(data, "name2", SUBMISSION_FIELD_MAXLEN["name2"])
+	contact    = _norm(data, "contact", SUBMISSION_FIELD_MAXLEN["contact"])
 
 	if not gstn or not legal_name or not firm_name or not name1 or not contact:
-		return jsonify({"ok": False, "message": "Please verify GSTIN and fill Name 1 & Contact."}), 400
+		return None, "Please verify GSTIN and fill Name 1 & Contact."
 	if len(gstn) != 15 or not GSTIN_REGEX.match(gstn):
-		return jsonify({"ok": False, "message": "GSTIN format looks invalid."}), 400
+		return None, "GSTIN format looks invalid."
+
+	return (gstn, legal_name, firm_name, name1, name2, contact), None
+
+@app.post("/submit")
+def submit():
+	data = _json_body(MAX_BODY_BYTES)
+	if data is None:
+		return jsonify({"ok": False, "message": "Request body too large."}), 413
+
+	row, error = _submission_row(data)
+	if error:
+		return jsonify({"ok": False, "message": error}), 400
 
 	try:
 		with get_pool().connection() as conn:
@@ -204,18 +454,77 @@ def submit():
 					"""
 					insert into submissions (gstn, legal_name, firm_name, name1, name2, contact, created_at)
 					values (%s, %s, %s, %s, %s, %s, now())
+					on conflict (gstn) do nothing
 					returning gstn;
 					""",
-					(gstn, legal_name, firm_name, name1, name2, contact),
+					row,
+					prepare=True,
 				)
-				inserted_gstn = cur.fetchone()[0]
-	except UniqueViolation:
-		return jsonify({"ok": False, "message": "This GSTIN already exists.", "code": "duplicate"}), 409
+				inserted = cur.fetchone()
 	except Exception as e:
 		log.exception("DB insert failed")
 		return jsonify({"ok": False, "message": f"DB insert failed: {e}"}), 500
 
-	return jsonify({"ok": True, "id": inserted_gstn})
+	if inserted is None:
+		return jsonify({"ok": False, "message": "This GSTIN already exists.", "code": "duplicate"}), 409
+
+	return jsonify({"ok": True, "id": inserted[0]})
+
+@app.post("/submit_batch")
+def submit_batch():
+	data = _json_body(MAX_BATCH_BODY_BYTES)
+	if data is None:
+		return jsonify({"ok": False, "message": "Request body too large."}), 413
+	items = data.get("submissions")
+
+	if not isinstance(items, list) or not items:
+		return jsonify({"ok": False, "message": "submissions must be a non-empty list."}), 400
+	if len(items) > SUBMIT_BATCH_MAX:
+		return jsonify({"ok": False, "message": f"At most {SUBMIT_BATCH_MAX} submissions per batch."}), 400
+
+	rows = []
+	invalid = []
+	repeats = []  # later copies of a GSTIN already in this batch
+	seen = set()
+	for i, item in enumerate(items):
+		row, error = _submission_row(item if isinstance(item, dict) else {})
+		if error:
+			invalid.append({"index": i, "message": error})
+		elif row[0] in seen:
+			repeats.append(row[0])
+		else:
+			seen.add(row[0])
+			rows.append(row)
+
+	inserted = []
+	if rows:
+		try:
+			with get_pool().connection() as conn:
+				with conn.cursor() as cur:
+					# One pipelined round trip; conflicting rows return nothing.
+					cur.executemany(
+						"""
+						insert into submissions (gstn, legal_name, firm_name, name1, name2, contact, created_at)
+						values (%s, %s, %s, %s, %s, %s, now())
+						on conflict (gstn) do nothing
+						returning gstn;
+						""",
+						rows,
+						returning=True,
+					)
+					while True:
+						r = cur.fetchone()
+						if r is not None:
+							inserted.append(r[0])
+						if not cur.nextset():
+							break
+		except Exception as e:
+			log.exception("DB batch insert failed")
+			return jsonify({"ok": False, "message": f"DB insert failed: {e}"}), 500
+
+	inserted_set = set(inserted)
+	duplicates = [row[0] for row in rows if row[0] not in inserted_set] + repeats
+	return jsonify({"ok": True, "inserted": inserted, "duplicates": duplicates, "invalid": invalid})
 
 if __name__ == "__main__":
 	debug = _env("FLASK_DEBUG", "0") == "1"